@@ -18,19 +18,28 @@ Metrics Exposed:
     vault_certificate_last_scanned_timestamp{hostname,cn} - Unix timestamp of last scan
     vault_certificates_total - Total number of certificates tracked
     vault_certificates_by_status{status} - Count of certificates by status
+    vault_cert_exporter_stale_seconds - Seconds since metrics were last refreshed from Vault
+    vault_cert_exporter_refresh_in_progress - 1 while a background refresh is running
+    vault_cert_exporter_cache_size - Certificate inventories held in memory
+    vault_cert_exporter_cache_evictions_total - Inventories evicted from the bounded cache
 
 """
 
 import argparse
+import functools
 import json
 import logging
 import os
 import sys
+import threading
 import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 try:
     import requests
@@ -40,6 +49,11 @@ except ImportError:
     print("ERROR: 'requests' module not found. Install with: pip3 install requests", file=sys.stderr)
     sys.exit(1)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 # Configure logging
 logging.basicConfig(
@@ -49,26 +63,145 @@ logging.basicConfig(
 logger = logging.getLogger('vault_cert_exporter')
 
 
+def _json_loads(content: bytes):
+    """Decode JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _json_dumps_pretty(obj) -> bytes:
+    """Encode JSON with indentation, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode('utf-8')
+
+
+# Prometheus label value escapes: backslash, double quote and newline
+_LABEL_ESCAPE = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+
+
+@functools.lru_cache(maxsize=8192)
+def _parse_iso_ts(value: str) -> int:
+    """Parse an ISO 8601 timestamp into Unix seconds (0 if unparseable)
+
+    Certificates issued or scanned together share timestamps, so results
+    are cached per unique string.
+    """
+    try:
+        return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+    except (AttributeError, ValueError):
+        return 0
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip (RFC 9110 q-values)"""
+    qvalues = {}
+    for token in accept_encoding.lower().split(','):
+        coding, _, params = token.partition(';')
+        coding = coding.strip()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding] = q
+
+    # An explicit gzip entry wins over the wildcard
+    return qvalues.get('gzip', qvalues.get('*', 0.0)) > 0
+
+
+def _current_rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB (None where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entries"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str):
+        """Return the cached value (None if absent), marking it recently used"""
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: str, value):
+        """Insert or replace a value, evicting the oldest entries beyond maxsize"""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._evict()
+
+    def pop(self, key: str):
+        """Remove an entry without counting it as an eviction"""
+        return self._data.pop(key, None)
+
+    def keys(self) -> List[str]:
+        return list(self._data)
+
+    def resize(self, maxsize: int):
+        """Change the capacity, evicting immediately if it shrank"""
+        self.maxsize = max(1, maxsize)
+        self._evict()
+
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
 class VaultClient:
     """Vault API client for certificate inventory queries"""
 
-    def __init__(self, vault_addr: str, role_id: str, secret_id: str, ca_cert: Optional[str] = None):
+    def __init__(self, vault_addr: str, role_id: str, secret_id: str, ca_cert: Optional[str] = None,
+                 pool_size: int = 64, token_refresh_margin: float = 0.01,
+                 summary_key: str = '_summary'):
         self.vault_addr = vault_addr.rstrip('/')
         self.role_id = role_id
         self.secret_id = secret_id
         self.ca_cert = ca_cert
+        self.pool_size = pool_size
+        self.token_refresh_margin = token_refresh_margin
+        self.summary_key = summary_key
         self.token = None
+        self.token_expires_at = 0.0
+        self._auth_lock = threading.Lock()
         self.session = self._create_session()
 
     def _create_session(self) -> requests.Session:
-        """Create requests session with retry logic"""
+        """Create requests session with retry logic and a keep-alive connection pool"""
         session = requests.Session()
+        session.headers['Connection'] = 'keep-alive'
         retry = Retry(
             total=3,
             backoff_factor=1,
             status_forcelist=[500, 502, 503, 504]
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        # Size the pool for concurrent fetches so TLS connections are reused
+        # instead of being discarded and re-handshaked on every request
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry
+        )
         session.mount('http://', adapter)
         session.mount('https://', adapter)
         return session
@@ -90,18 +223,40 @@ class VaultClient:
             )
             response.raise_for_status()
 
-            data = response.json()
+            data = _json_loads(response.content)
             self.token = data['auth']['client_token']
-            logger.info("Successfully authenticated to Vault")
+
+            # Refresh shortly before the token TTL runs out (0 = no expiry)
+            lease_duration = int(data['auth'].get('lease_duration', 0))
+            if lease_duration > 0:
+                self.token_expires_at = time.monotonic() + lease_duration * (1 - self.token_refresh_margin)
+            else:
+                self.token_expires_at = float('inf')
+
+            logger.info(f"Successfully authenticated to Vault (token TTL: {lease_duration}s)")
             return True
 
         except Exception as e:
             logger.error(f"Vault authentication failed: {e}")
             return False
 
-    def list_certificates(self) -> List[str]:
-        """List all certificate inventory keys from Vault KV"""
+    def _ensure_token(self) -> bool:
+        """Authenticate if there is no token or the cached token is about to expire"""
+        if self.token and time.monotonic() < self.token_expires_at:
+            return True
+
+        with self._auth_lock:
+            # Another fetch thread may have re-authenticated while we waited
+            if self.token and time.monotonic() < self.token_expires_at:
+                return True
+            return self.authenticate()
+
+    def list_certificates(self) -> Optional[List[str]]:
+        """List all certificate inventory keys from Vault KV (None on failure)"""
         try:
+            if not self._ensure_token():
+                raise Exception("Vault authentication failed")
+
             url = f"{self.vault_addr}/v1/secrets/metadata/certificates"
             headers = {"X-Vault-Token": self.token}
 
@@ -112,152 +267,570 @@ class VaultClient:
                 verify=self.ca_cert if self.ca_cert else True,
                 timeout=10
             )
+            # Vault answers LIST with 404 when there are no keys yet
+            if response.status_code == 404:
+                logger.info("Found 0 certificate inventories in Vault KV")
+                return []
             response.raise_for_status()
 
-            data = response.json()
-            keys = data.get('data', {}).get('keys', [])
+            data = _json_loads(response.content)
+            keys = [key for key in data.get('data', {}).get('keys', []) if key != self.summary_key]
             logger.info(f"Found {len(keys)} certificate inventories in Vault KV")
             return keys
 
         except Exception as e:
             logger.error(f"Failed to list certificates: {e}")
-            return []
+            return None
+
+    @staticmethod
+    def _valid_inventory(inventory) -> bool:
+        """Check a summary entry has the shape of a per-host inventory document"""
+        if not isinstance(inventory, dict):
+            return False
+        cert_list = inventory.get('certificates', [])
+        return isinstance(cert_list, list) and all(isinstance(cert, dict) for cert in cert_list)
+
+    def get_summary(self) -> Optional[Tuple[Optional[int], Dict[str, Dict]]]:
+        """Retrieve the KV version and pre-aggregated {hostname: inventory} summary, if one is maintained"""
+        if not self.summary_key:
+            return None
+
+        try:
+            if not self._ensure_token():
+                raise Exception("Vault authentication failed")
+
+            url = f"{self.vault_addr}/v1/secrets/data/certificates/{self.summary_key}"
+            headers = {"X-Vault-Token": self.token}
+
+            response = self.session.get(
+                url,
+                headers=headers,
+                verify=self.ca_cert if self.ca_cert else True,
+                timeout=30
+            )
+            if response.status_code == 404:
+                logger.debug(f"No certificate summary at certificates/{self.summary_key}")
+                return None
+            response.raise_for_status()
+
+            data = _json_loads(response.content).get('data', {})
+            summary = data.get('data')
+            if not isinstance(summary, dict):
+                logger.warning(f"Certificate summary at certificates/{self.summary_key} is not a map, using per-host reads")
+                return None
+
+            # A summary written with `vault kv patch key=@file` stores strings, not
+            # inventories; fall back to per-host reads rather than fail every refresh
+            malformed = [hostname for hostname, inventory in summary.items() if not self._valid_inventory(inventory)]
+            if malformed:
+                logger.warning(
+                    f"Certificate summary has {len(malformed)} malformed entries "
+                    f"(e.g. {malformed[0]}), using per-host reads"
+                )
+                return None
+
+            logger.info(f"Loaded {len(summary)} certificate inventories from summary")
+            return (data.get('metadata') or {}).get('version'), summary
+
+        except Exception as e:
+            logger.warning(f"Failed to get certificate summary: {e}")
+            return None
 
-    def get_certificate(self, hostname: str) -> Optional[Dict]:
-        """Retrieve certificate inventory for specific hostname"""
+    def get_metadata(self, hostname: str) -> Optional[Dict]:
+        """Retrieve KV metadata (current_version, updated_time) for specific hostname"""
         try:
+            if not self._ensure_token():
+                raise Exception("Vault authentication failed")
+
+            url = f"{self.vault_addr}/v1/secrets/metadata/certificates/{hostname}"
+            headers = {"X-Vault-Token": self.token}
+
+            response = self.session.get(
+                url,
+                headers=headers,
+                verify=self.ca_cert if self.ca_cert else True,
+                timeout=10
+            )
+            response.raise_for_status()
+
+            data = _json_loads(response.content).get('data', {})
+            return {
+                'current_version': data.get('current_version'),
+                'updated_time': data.get('updated_time')
+            }
+
+        except Exception as e:
+            logger.warning(f"Failed to get certificate metadata for {hostname}: {e}")
+            return None
+
+    def get_certificate(self, hostname: str, version: Optional[int] = None) -> Optional[Dict]:
+        """Retrieve certificate inventory for specific hostname (latest or a given version)"""
+        try:
+            if not self._ensure_token():
+                raise Exception("Vault authentication failed")
+
             url = f"{self.vault_addr}/v1/secrets/data/certificates/{hostname}"
             headers = {"X-Vault-Token": self.token}
 
             response = self.session.get(
                 url,
                 headers=headers,
+                params={'version': version} if version else None,
                 verify=self.ca_cert if self.ca_cert else True,
                 timeout=10
             )
             response.raise_for_status()
 
-            data = response.json()
+            data = _json_loads(response.content)
             return data.get('data', {}).get('data', {})
 
         except Exception as e:
             logger.warning(f"Failed to get certificate for {hostname}: {e}")
             return None
 
+    def _fetch_concurrently(self, fetch: Callable[[str], Optional[Dict]], hostnames: List[str],
+                            concurrency: int, batch_size_percent: int, what: str) -> Dict[str, Dict]:
+        """Run fetch for each hostname on a thread pool, returning successful results by hostname"""
+        results = {}
+        if not hostnames:
+            return results
+
+        # Queue every hostname at once so a slow host only occupies one worker;
+        # batches exist only to log progress, so a stalled batch is visible
+        batch_size = max(1, len(hostnames) * batch_size_percent // 100)
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(fetch, hostname) for hostname in hostnames]
+
+            for start in range(0, len(hostnames), batch_size):
+                batch = hostnames[start:start + batch_size]
+                for hostname, future in zip(batch, futures[start:start + batch_size]):
+                    result = future.result()
+                    if result:
+                        results[hostname] = result
+
+                logger.debug(
+                    f"Batch of {len(batch)} {what} complete "
+                    f"at {time.monotonic() - started:.3f}s"
+                )
+
+        return results
+
+    def get_metadata_batch(self, hostnames: List[str], concurrency: int = 16,
+                           batch_size_percent: int = 25) -> Dict[str, Dict]:
+        """Retrieve KV metadata for many hostnames concurrently, keyed by hostname"""
+        return self._fetch_concurrently(
+            self.get_metadata, hostnames, concurrency, batch_size_percent, "metadata entries"
+        )
+
+    def get_certificates(self, hostnames: List[str], concurrency: int = 16,
+                         batch_size_percent: int = 25,
+                         versions: Optional[Dict[str, int]] = None) -> Dict[str, Dict]:
+        """Retrieve certificate inventories for many hostnames concurrently, keyed by hostname"""
+        versions = versions or {}
+        return self._fetch_concurrently(
+            lambda hostname: self.get_certificate(hostname, versions.get(hostname)),
+            hostnames, concurrency, batch_size_percent, "certificates"
+        )
+
 
 class CertificateMetrics:
     """Generate Prometheus metrics from certificate data"""
 
+    # Status names indexed by numeric status value
+    _STATUS_NAMES = ("healthy", "warning", "critical", "expired")
+    _STATUS_LABELS = tuple(name.encode('ascii') for name in _STATUS_NAMES)
+
+    # All four per-certificate lines, formatted in one pass. Serials are hex
+    # (validated by the inventory writers), so they are truncated by the
+    # %.16s width instead of being sliced and escaped.
+    _CERT_TEMPLATE = (
+        b'vault_certificate_days_until_expiry{%s,serial="%.16s"} %d\n'
+        b'vault_certificate_renewal_needed{%s,serial="%.16s"} %d\n'
+        b'vault_certificate_status{%s,status="%s"} %d\n'
+        b'vault_certificate_last_scanned_timestamp{%s,serial="%.16s"} %d\n'
+    )
+
+    # Static HELP/TYPE headers, built once instead of on every refresh
+    _CERT_HEADER = (
+        b"# HELP vault_certificate_days_until_expiry Days until certificate expires\n"
+        b"# TYPE vault_certificate_days_until_expiry gauge\n"
+        b"# HELP vault_certificate_renewal_needed Certificate renewal needed (1=yes, 0=no)\n"
+        b"# TYPE vault_certificate_renewal_needed gauge\n"
+        b"# HELP vault_certificate_status Certificate status (0=healthy, 1=warning, 2=critical, 3=expired)\n"
+        b"# TYPE vault_certificate_status gauge\n"
+        b"# HELP vault_certificate_last_scanned_timestamp Unix timestamp of last certificate scan\n"
+        b"# TYPE vault_certificate_last_scanned_timestamp gauge\n"
+    )
+    _TOTAL_HEADER = (
+        b"# HELP vault_certificates_total Total number of certificates tracked\n"
+        b"# TYPE vault_certificates_total gauge\n"
+    )
+    _BY_STATUS_HEADER = (
+        b"# HELP vault_certificates_by_status Count of certificates by status\n"
+        b"# TYPE vault_certificates_by_status gauge\n"
+    )
+    _LAST_SCRAPE_HEADER = (
+        b"# HELP vault_cert_exporter_last_scrape_timestamp Unix timestamp of last successful scrape\n"
+        b"# TYPE vault_cert_exporter_last_scrape_timestamp gauge\n"
+    )
+    _STALE_HEADER = (
+        b"# HELP vault_cert_exporter_stale_seconds Seconds since the served metrics were last refreshed from Vault\n"
+        b"# TYPE vault_cert_exporter_stale_seconds gauge\n"
+    )
+    _REFRESH_HEADER = (
+        b"# HELP vault_cert_exporter_refresh_in_progress Background refresh from Vault in progress (1=yes, 0=no)\n"
+        b"# TYPE vault_cert_exporter_refresh_in_progress gauge\n"
+    )
+    _CACHE_SIZE_HEADER = (
+        b"# HELP vault_cert_exporter_cache_size Certificate inventories held in the in-memory cache\n"
+        b"# TYPE vault_cert_exporter_cache_size gauge\n"
+    )
+    _CACHE_EVICTIONS_HEADER = (
+        b"# HELP vault_cert_exporter_cache_evictions_total Certificate inventories evicted from the in-memory cache\n"
+        b"# TYPE vault_cert_exporter_cache_evictions_total counter\n"
+    )
+
     def __init__(self, warning_days: int = 30, critical_days: int = 7):
         self.warning_days = warning_days
         self.critical_days = critical_days
-        self.metrics = []
+        self.buf = bytearray()
+
+    def _emit(self, line: str):
+        """Append a metric line to the output buffer"""
+        self.buf += line.encode('utf-8')
+        self.buf += b'\n'
 
     def _escape_label(self, value: str) -> str:
         """Escape label values for Prometheus format"""
-        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        # Most values need no escaping, so skip the translate in that case
+        if '\\' not in value and '"' not in value and '\n' not in value:
+            return value
+        return value.translate(_LABEL_ESCAPE)
+
+    def _render_certificate(self, cert_data: Dict, status_counts: List[int]) -> bytes:
+        """Render the metric lines for one certificate inventory, counting its status"""
+        hostname = cert_data.get('hostname', 'unknown')
+
+        cert_list = cert_data.get('certificates', [])
+        if not cert_list:
+            return b''
 
-    def _determine_status(self, days_until_expiry: int) -> str:
-        """Determine certificate status based on expiry"""
+        cert_info = cert_list[0]
+        days_until_expiry = int(cert_info.get('days_until_expiry', 0))
+
+        # Determine status (0=healthy, 1=warning, 2=critical, 3=expired)
         if days_until_expiry <= 0:
-            return "expired"
+            status_value = 3
         elif days_until_expiry <= self.critical_days:
-            return "critical"
+            status_value = 2
         elif days_until_expiry <= self.warning_days:
-            return "warning"
+            status_value = 1
         else:
-            return "healthy"
-
-    def _status_to_value(self, status: str) -> int:
-        """Convert status string to numeric value"""
-        status_map = {
-            "healthy": 0,
-            "warning": 1,
-            "critical": 2,
-            "expired": 3
-        }
-        return status_map.get(status, 0)
+            status_value = 0
+        status_counts[status_value] += 1
+
+        cn = self._escape_label(cert_info.get('common_name', 'unknown'))
+        serial = cert_info.get('serial_number', 'unknown').encode('utf-8')
+        renewal_needed = 1 if cert_info.get('renewal_needed', False) else 0
 
-    def generate(self, certificates: List[Dict]) -> str:
+        # Parse last scanned timestamp
+        last_scanned = cert_info.get('last_scanned', cert_info.get('last_issued', ''))
+        ts = _parse_iso_ts(last_scanned) if last_scanned else 0
+
+        # Generate metric lines directly as bytes
+        host_cn = b'hostname="%s",cn="%s"' % (hostname.encode('utf-8'), cn.encode('utf-8'))
+
+        return self._CERT_TEMPLATE % (
+            host_cn, serial, days_until_expiry,
+            host_cn, serial, renewal_needed,
+            host_cn, self._STATUS_LABELS[status_value], status_value,
+            host_cn, serial, ts
+        )
+
+    def generate(self, certificates: List[Dict]) -> bytes:
         """Generate Prometheus metrics from certificate data"""
-        self.metrics = []
-
-        # Counters by status
-        status_counts = {
-            "healthy": 0,
-            "warning": 0,
-            "critical": 0,
-            "expired": 0
-        }
+        # Start from the metric headers with descriptions
+        self.buf = bytearray(self._CERT_HEADER)
 
-        # Add metric headers with descriptions
-        self.metrics.append("# HELP vault_certificate_days_until_expiry Days until certificate expires")
-        self.metrics.append("# TYPE vault_certificate_days_until_expiry gauge")
+        # Counters by status value
+        status_counts = [0, 0, 0, 0]
 
-        self.metrics.append("# HELP vault_certificate_renewal_needed Certificate renewal needed (1=yes, 0=no)")
-        self.metrics.append("# TYPE vault_certificate_renewal_needed gauge")
+        # Render each certificate to one bytes chunk and join them once
+        self.buf += b''.join(self._render_certificate(cert_data, status_counts) for cert_data in certificates)
 
-        self.metrics.append("# HELP vault_certificate_status Certificate status (0=healthy, 1=warning, 2=critical, 3=expired)")
-        self.metrics.append("# TYPE vault_certificate_status gauge")
+        # Add summary metrics
+        self.buf += self._TOTAL_HEADER
+        self._emit(f"vault_certificates_total {len(certificates)}")
+
+        self.buf += self._BY_STATUS_HEADER
+        for status, count in zip(self._STATUS_NAMES, status_counts):
+            self._emit(f'vault_certificates_by_status{{status="{status}"}} {count}')
+
+        return bytes(self.buf)
+
+    def generate_exporter_status(self, last_refresh: float, stale_seconds: float,
+                                 refresh_in_progress: bool, cache_size: int = 0,
+                                 cache_evictions: int = 0) -> bytes:
+        """Generate exporter self-monitoring metrics, rendered per request"""
+        return (
+            self._LAST_SCRAPE_HEADER
+            + b'vault_cert_exporter_last_scrape_timestamp %d\n' % last_refresh
+            + self._STALE_HEADER
+            + b'vault_cert_exporter_stale_seconds %.3f\n' % stale_seconds
+            + self._REFRESH_HEADER
+            + b'vault_cert_exporter_refresh_in_progress %d\n' % (1 if refresh_in_progress else 0)
+            + self._CACHE_SIZE_HEADER
+            + b'vault_cert_exporter_cache_size %d\n' % cache_size
+            + self._CACHE_EVICTIONS_HEADER
+            + b'vault_cert_exporter_cache_evictions_total %d\n' % cache_evictions
+        )
 
-        self.metrics.append("# HELP vault_certificate_last_scanned_timestamp Unix timestamp of last certificate scan")
-        self.metrics.append("# TYPE vault_certificate_last_scanned_timestamp gauge")
 
-        # Process each certificate
-        for cert_data in certificates:
-            hostname = cert_data.get('hostname', 'unknown')
-            fqdn = cert_data.get('fqdn', 'unknown')
+class MetricsCache:
+    """Last-known-good metrics payload shared by the refresher and HTTP handlers"""
+
+    def __init__(self):
+        self.metrics = b""
+        self.metrics_gzip = b""
+        self.gzip_compressor = None
+        self.generated_at = 0.0
+        self.refresh_in_progress = False
+        self.inventory_size = 0
+        self.inventory_evictions = 0
+        self.lock = threading.Lock()
+
+    def update(self, metrics: bytes):
+        """Swap in a freshly generated payload, compressed once for gzip clients"""
+        # Compress the payload but leave the gzip stream open; each request
+        # finishes a copy of the compressor with its own status lines
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        metrics_gzip = compressor.compress(metrics) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        with self.lock:
+            self.metrics = metrics
+            self.metrics_gzip = metrics_gzip
+            self.gzip_compressor = compressor
+            self.generated_at = time.time()
+
+    def touch(self):
+        """Mark the current payload as refreshed without replacing it"""
+        with self.lock:
+            self.generated_at = time.time()
+
+    def set_inventory_stats(self, size: int, evictions: int):
+        """Record the refresher's inventory cache size and eviction count"""
+        with self.lock:
+            self.inventory_size = size
+            self.inventory_evictions = evictions
+
+    def inventory_stats(self) -> Tuple[int, int]:
+        """Return the inventory cache size and eviction count"""
+        with self.lock:
+            return self.inventory_size, self.inventory_evictions
+
+    def set_refreshing(self, refreshing: bool):
+        """Record whether a background refresh is running"""
+        with self.lock:
+            self.refresh_in_progress = refreshing
+
+    def snapshot(self) -> Tuple[bytes, float, bool]:
+        """Return the current payload, its generation time and refresh state"""
+        with self.lock:
+            return self.metrics, self.generated_at, self.refresh_in_progress
+
+    def snapshot_gzip(self) -> Tuple[bytes, Any, float, bool]:
+        """Return the open gzip stream of the current payload and its compressor"""
+        with self.lock:
+            return self.metrics_gzip, self.gzip_compressor, self.generated_at, self.refresh_in_progress
+
+
+class MetricsRefresher:
+    """Background thread that periodically rebuilds the metrics cache from Vault"""
+
+    def __init__(self, vault_client: VaultClient, metrics_generator: CertificateMetrics,
+                 cache: MetricsCache, interval: int = 60, fetch_concurrency: int = 16,
+                 batch_size_percent: int = 25, cache_max_certs: int = 100000,
+                 memory_soft_limit_mb: int = 0):
+        self.vault_client = vault_client
+        self.metrics_generator = metrics_generator
+        self.cache = cache
+        self.interval = interval
+        self.fetch_concurrency = fetch_concurrency
+        self.batch_size_percent = batch_size_percent
+        self.cache_max_certs = cache_max_certs
+        self.memory_soft_limit_mb = memory_soft_limit_mb
+
+        # (KV version, inventory) last seen per hostname, for delta refreshes.
+        # Bounds only what is kept between refreshes; a refresh itself still
+        # holds every inventory while rendering. Evicted hostnames are simply
+        # re-fetched on the next refresh.
+        self._inventory = LRUCache(cache_max_certs)
+
+        # RSS when the cache was last shrunk, to tell whether shrinking helped
+        self._shrunk_at_rss_mb = None
+
+        # Hash of the (hostname, version) state behind the cached payload
+        self._last_state_hash = None
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _apply_memory_pressure(self):
+        """Shrink the inventory cache while RSS stays above the soft limit
+
+        Capacity at most halves per refresh and never drops below a tenth of
+        cache_max_certs. The allocator rarely returns freed inventories to the
+        OS, so if RSS did not fall after the last shrink the capacity is held
+        rather than shrunk again. Capacity doubles back once RSS is below 90%
+        of the soft limit.
+        """
+        if not self.memory_soft_limit_mb:
+            return
+
+        rss_mb = _current_rss_mb()
+        if rss_mb is None:
+            return
+
+        soft = self.memory_soft_limit_mb
+        current = self._inventory.maxsize
+        maxsize = current
+
+        if rss_mb > soft:
+            if self._shrunk_at_rss_mb is None or rss_mb < self._shrunk_at_rss_mb:
+                maxsize = max(self.cache_max_certs // 10, current // 2, 1)
+                self._shrunk_at_rss_mb = rss_mb
+        elif rss_mb < soft * 0.9:
+            maxsize = min(self.cache_max_certs, current * 2)
+            self._shrunk_at_rss_mb = None
+
+        if maxsize != current:
+            logger.info(f"RSS {rss_mb:.0f}MB (soft limit {soft}MB): inventory cache capacity set to {maxsize}")
+            self._inventory.resize(maxsize)
+
+    def _fetch_changed(self, hostnames: List[str]) -> Tuple[List[Dict], Optional[int]]:
+        """Fetch only inventories whose KV version changed since the last refresh
+
+        Returns the inventories in listing order and a hash of the
+        (hostname, version) pairs behind them, None if any version is unknown.
+        """
+        metadata = self.vault_client.get_metadata_batch(
+            hostnames,
+            concurrency=self.fetch_concurrency,
+            batch_size_percent=self.batch_size_percent
+        )
 
-            cert_list = cert_data.get('certificates', [])
-            if not cert_list:
+        unchanged = {}
+        changed = {}
+        for hostname in hostnames:
+            version = metadata.get(hostname, {}).get('current_version')
+            cached = self._inventory.get(hostname)
+            if cached is None or version is None or version != cached[0]:
+                changed[hostname] = version
+            else:
+                unchanged[hostname] = cached
+
+        fetched = {}
+        if changed:
+            fetched = self.vault_client.get_certificates(
+                list(changed),
+                concurrency=self.fetch_concurrency,
+                batch_size_percent=self.batch_size_percent,
+                versions={hostname: version for hostname, version in changed.items() if version}
+            )
+            for hostname, cert_data in fetched.items():
+                self._inventory.put(hostname, (changed[hostname], cert_data))
+
+        # Forget hostnames that were removed from Vault
+        listed = set(hostnames)
+        for hostname in [h for h in self._inventory.keys() if h not in listed]:
+            self._inventory.pop(hostname)
+
+        # Build from this refresh's results, which may already have been evicted
+        certificates = []
+        state = []
+        for hostname in hostnames:
+            if hostname in fetched:
+                version, cert_data = changed[hostname], fetched[hostname]
+            elif hostname in unchanged:
+                version, cert_data = unchanged[hostname]
+            elif hostname in changed:
+                # Fetch failed; fall back to whatever is still cached
+                cached = self._inventory.get(hostname)
+                if cached is None:
+                    continue
+                version, cert_data = cached
+            else:
                 continue
+            certificates.append(cert_data)
+            state.append((hostname, version))
 
-            cert_info = cert_list[0]
-            cn = self._escape_label(cert_info.get('common_name', 'unknown'))
-            serial = self._escape_label(cert_info.get('serial_number', 'unknown')[:16])
-            days_until_expiry = int(cert_info.get('days_until_expiry', 0))
-            renewal_needed = 1 if cert_info.get('renewal_needed', False) else 0
-
-            # Determine status
-            status = self._determine_status(days_until_expiry)
-            status_counts[status] += 1
-            status_value = self._status_to_value(status)
-
-            # Parse last scanned timestamp
-            last_scanned = cert_info.get('last_scanned', cert_info.get('last_issued', ''))
-            try:
-                if last_scanned:
-                    ts = int(datetime.fromisoformat(last_scanned.replace('Z', '+00:00')).timestamp())
-                else:
-                    ts = 0
-            except:
-                ts = 0
-
-            # Generate metric lines
-            labels = f'hostname="{hostname}",cn="{cn}",serial="{serial}"'
-            status_labels = f'hostname="{hostname}",cn="{cn}",status="{status}"'
-
-            self.metrics.append(f'vault_certificate_days_until_expiry{{{labels}}} {days_until_expiry}')
-            self.metrics.append(f'vault_certificate_renewal_needed{{{labels}}} {renewal_needed}')
-            self.metrics.append(f'vault_certificate_status{{{status_labels}}} {status_value}')
-            self.metrics.append(f'vault_certificate_last_scanned_timestamp{{{labels}}} {ts}')
+        logger.info(f"Fetched {len(changed)} changed of {len(hostnames)} certificate inventories")
 
-        # Add summary metrics
-        self.metrics.append("# HELP vault_certificates_total Total number of certificates tracked")
-        self.metrics.append("# TYPE vault_certificates_total gauge")
-        self.metrics.append(f"vault_certificates_total {len(certificates)}")
+        if any(version is None for _, version in state):
+            return certificates, None
+        return certificates, hash(('fanout', tuple(state)))
+
+    def refresh(self) -> bool:
+        """Fetch certificates from Vault and replace the cached metrics"""
+        self.cache.set_refreshing(True)
+        started = time.monotonic()
+        try:
+            # One bulk read when the writer maintains a summary, else per-host fanout
+            summary = self.vault_client.get_summary()
+            if summary is not None:
+                summary_version, summary_data = summary
+                certificates = list(summary_data.values())
+                state_hash = hash(('summary', summary_version)) if summary_version is not None else None
+            else:
+                hostnames = self.vault_client.list_certificates()
+                if hostnames is None:
+                    raise Exception("Unable to list certificates from Vault")
+
+                self._apply_memory_pressure()
+                certificates, state_hash = self._fetch_changed(hostnames)
+                self.cache.set_inventory_stats(len(self._inventory), self._inventory.evictions)
+
+            # Nothing changed in Vault: keep the rendered (and compressed) payload
+            if state_hash is not None and state_hash == self._last_state_hash:
+                self.cache.touch()
+                logger.info(
+                    f"Certificate inventories unchanged, reusing metrics for {len(certificates)} certificates"
+                )
+                return True
+
+            metrics = self.metrics_generator.generate(certificates)
+            self.cache.update(metrics)
+            self._last_state_hash = state_hash
+
+            logger.info(
+                f"Generated metrics for {len(certificates)} certificates "
+                f"in {time.monotonic() - started:.3f}s"
+            )
+            return True
+
+        except Exception as e:
+            # Keep serving the last-known-good metrics
+            logger.error(f"Error refreshing metrics: {e}")
+            return False
 
-        self.metrics.append("# HELP vault_certificates_by_status Count of certificates by status")
-        self.metrics.append("# TYPE vault_certificates_by_status gauge")
-        for status, count in status_counts.items():
-            self.metrics.append(f'vault_certificates_by_status{{status="{status}"}} {count}')
+        finally:
+            self.cache.set_refreshing(False)
 
-        # Add exporter metadata
-        self.metrics.append("# HELP vault_cert_exporter_last_scrape_timestamp Unix timestamp of last successful scrape")
-        self.metrics.append("# TYPE vault_cert_exporter_last_scrape_timestamp gauge")
-        self.metrics.append(f"vault_cert_exporter_last_scrape_timestamp {int(time.time())}")
+    def run(self):
+        """Refresh loop, runs until stop() is called"""
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.interval)
 
-        return '\n'.join(self.metrics) + '\n'
+    def start(self):
+        """Start the refresh loop in a daemon thread"""
+        self._thread = threading.Thread(target=self.run, name='metrics-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Signal the refresh loop to exit"""
+        self._stop_event.set()
 
 
 class MetricsHandler(BaseHTTPRequestHandler):
@@ -265,9 +838,8 @@ class MetricsHandler(BaseHTTPRequestHandler):
 
     vault_client: VaultClient = None
     metrics_generator: CertificateMetrics = None
+    metrics_cache: MetricsCache = None
     cache_duration: int = 60
-    cached_metrics: str = ""
-    last_scrape: float = 0
 
     def do_GET(self):
         """Handle GET requests"""
@@ -281,45 +853,47 @@ class MetricsHandler(BaseHTTPRequestHandler):
             self.wfile.write(b"404 Not Found")
 
     def serve_metrics(self):
-        """Serve Prometheus metrics"""
+        """Serve Prometheus metrics from the background-refreshed cache"""
         try:
-            # Check cache
-            current_time = time.time()
-            if current_time - self.last_scrape < self.cache_duration and self.cached_metrics:
-                logger.debug("Serving cached metrics")
-                metrics = self.cached_metrics
+            use_gzip = _accepts_gzip(self.headers.get('Accept-Encoding', ''))
+            if use_gzip:
+                metrics, compressor, generated_at, refresh_in_progress = self.metrics_cache.snapshot_gzip()
             else:
-                # Re-authenticate if needed
-                if not self.vault_client.token:
-                    if not self.vault_client.authenticate():
-                        raise Exception("Vault authentication failed")
-
-                # Fetch certificates
-                hostnames = self.vault_client.list_certificates()
-                certificates = []
-
-                for hostname in hostnames:
-                    cert_data = self.vault_client.get_certificate(hostname)
-                    if cert_data:
-                        certificates.append(cert_data)
-
-                # Generate metrics
-                metrics = self.metrics_generator.generate(certificates)
-
-                # Update cache
-                self.__class__.cached_metrics = metrics
-                self.__class__.last_scrape = current_time
+                metrics, generated_at, refresh_in_progress = self.metrics_cache.snapshot()
+            if not generated_at:
+                self.send_response(503)
+                self.end_headers()
+                self.wfile.write(b"Metrics not yet available, initial refresh in progress")
+                return
+
+            cache_size, cache_evictions = self.metrics_cache.inventory_stats()
+            status = self.metrics_generator.generate_exporter_status(
+                last_refresh=generated_at,
+                stale_seconds=time.time() - generated_at,
+                refresh_in_progress=refresh_in_progress,
+                cache_size=cache_size,
+                cache_evictions=cache_evictions
+            )
 
-                logger.info(f"Generated metrics for {len(certificates)} certificates")
+            # The status lines change per request; append them to a copy of the
+            # open gzip stream rather than recompressing the cached payload
+            if use_gzip:
+                compressor = compressor.copy()
+                status = compressor.compress(status) + compressor.flush()
 
             # Send response
             self.send_response(200)
             self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Content-Length', str(len(metrics) + len(status)))
             self.end_headers()
-            self.wfile.write(metrics.encode('utf-8'))
+            self.wfile.write(metrics)
+            self.wfile.write(status)
 
         except Exception as e:
-            logger.error(f"Error generating metrics: {e}")
+            logger.error(f"Error serving metrics: {e}")
             self.send_response(500)
             self.end_headers()
             self.wfile.write(f"Error: {str(e)}".encode('utf-8'))
@@ -329,13 +903,15 @@ class MetricsHandler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Content-Type', 'application/json')
         self.end_headers()
+        _, generated_at, refresh_in_progress = self.metrics_cache.snapshot()
         health = {
             "status": "healthy",
             "vault_addr": self.vault_client.vault_addr,
-            "last_scrape": self.last_scrape,
+            "last_scrape": generated_at,
+            "refresh_in_progress": refresh_in_progress,
             "cache_duration": self.cache_duration
         }
-        self.wfile.write(json.dumps(health, indent=2).encode('utf-8'))
+        self.wfile.write(_json_dumps_pretty(health))
 
     def log_message(self, format, *args):
         """Override to use custom logger"""
@@ -349,9 +925,15 @@ def main():
     parser.add_argument('--secret-id', help='Vault AppRole secret ID (or set VAULT_SECRET_ID env var)')
     parser.add_argument('--ca-cert', help='Path to Vault CA certificate')
     parser.add_argument('--port', type=int, default=9090, help='Exporter HTTP port (default: 9090)')
-    parser.add_argument('--cache-duration', type=int, default=60, help='Metrics cache duration in seconds (default: 60)')
+    parser.add_argument('--cache-duration', type=int, default=60, help='Interval between background metrics refreshes from Vault in seconds (default: 60)')
     parser.add_argument('--warning-days', type=int, default=30, help='Warning threshold in days (default: 30)')
     parser.add_argument('--critical-days', type=int, default=7, help='Critical threshold in days (default: 7)')
+    parser.add_argument('--fetch-concurrency', type=int, default=16, help='Concurrent Vault certificate fetches (default: 16)')
+    parser.add_argument('--batch-size-percent', type=int, default=25, help='Certificates per progress-logging batch, as a percentage of the inventory (default: 25)')
+    parser.add_argument('--token-refresh-margin', type=float, default=0.01, help='Fraction of the Vault token TTL to re-authenticate early (default: 0.01)')
+    parser.add_argument('--summary-key', default='_summary', help='KV key under certificates/ holding a pre-aggregated inventory summary; empty to disable (default: _summary)')
+    parser.add_argument('--cache-max-certs', type=int, default=100000, help='Maximum certificate inventories cached between refreshes; does not bound RSS or refresh peak memory (default: 100000)')
+    parser.add_argument('--memory-soft-limit-mb', type=int, default=0, help='RSS in MB above which the between-refresh inventory cache shrinks, down to a tenth of --cache-max-certs; 0 disables (default: 0)')
     parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='Log level')
 
     args = parser.parse_args()
@@ -372,7 +954,10 @@ def main():
         vault_addr=args.vault_addr,
         role_id=role_id,
         secret_id=secret_id,
-        ca_cert=args.ca_cert
+        ca_cert=args.ca_cert,
+        pool_size=max(64, args.fetch_concurrency),
+        token_refresh_margin=args.token_refresh_margin,
+        summary_key=args.summary_key
     )
 
     # Authenticate to Vault
@@ -386,13 +971,28 @@ def main():
         critical_days=args.critical_days
     )
 
+    # Refresh metrics in the background; requests are served from the cache
+    metrics_cache = MetricsCache()
+    refresher = MetricsRefresher(
+        vault_client=vault_client,
+        metrics_generator=metrics_generator,
+        cache=metrics_cache,
+        interval=args.cache_duration,
+        fetch_concurrency=args.fetch_concurrency,
+        batch_size_percent=args.batch_size_percent,
+        cache_max_certs=args.cache_max_certs,
+        memory_soft_limit_mb=args.memory_soft_limit_mb
+    )
+    refresher.start()
+
     # Set up HTTP handler
     MetricsHandler.vault_client = vault_client
     MetricsHandler.metrics_generator = metrics_generator
+    MetricsHandler.metrics_cache = metrics_cache
     MetricsHandler.cache_duration = args.cache_duration
 
-    # Start HTTP server
-    server = HTTPServer(('0.0.0.0', args.port), MetricsHandler)
+    # Start HTTP server (one thread per request, so /health never waits on a scrape)
+    server = ThreadingHTTPServer(('0.0.0.0', args.port), MetricsHandler)
     logger.info(f"Starting Vault Certificate Exporter on port {args.port}")
     logger.info(f"Metrics endpoint: http://0.0.0.0:{args.port}/metrics")
     logger.info(f"Health endpoint: http://0.0.0.0:{args.port}/health")
@@ -401,6 +1001,7 @@ def main():
         server.serve_forever()
     except KeyboardInterrupt:
         logger.info("Shutting down exporter...")
+        refresher.stop()
         server.shutdown()
 
 